@@ -1,63 +1,100 @@
 ﻿import sqlite3
+import hashlib
 import logging
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 log = logging.getLogger("library")
-import time
+import asyncio
+import contextlib
+import queue
+import threading
 from urllib.parse import quote
-from io import BytesIO
 import subprocess
-import sys, json
+import tempfile
+import sys, os, json
 import re
 import shutil
+import importlib.util
 import argparse
-import requests
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Missing packages are reported by check_dependencies() instead of failing at import
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 
-from pdfminer.high_level import extract_text
+# PDF libraries are only needed once a Google PDF is downloaded (and pdfminer/ocrmypdf
+# only when pypdf comes up empty), so they are imported on first use
 
 DB_PATH_DEFAULT = "library.db"
 
-SESSION = None
+# One pooled aiohttp session per downloader domain, opened by open_sessions()
+SESSIONS = {}
+
+# Politeness: at most this many downloads in flight per source site
+PER_DOMAIN_CONCURRENCY = 2
+LIMIT_PER_HOST = 4
+# ...and downloads from the same site start at least this many seconds apart
+RATE_LIMIT_INTERVAL = 1.0
+
+# Connection pooling: keep TLS sockets to the few source hosts open between fetches
+POOL_SIZE = 32
+KEEPALIVE_TIMEOUT = 60
+
+# Transient failures are retried with exponential backoff
+RETRY_TOTAL = 5
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Extracted PDF text keyed by the SHA-256 of the PDF bytes, so re-runs skip pdfminer/OCR.
+# A separate connection from the book writer's, only used from the event loop.
+PDF_CACHE = None
+
+# PDF parsing and OCR are CPU-bound, so they run in worker processes (started by process_input)
+PDF_POOL = None
+
+# Only the first MAX_PAGES pages of a PDF are extracted (0 = no limit); long Google
+# Books scans past this point are rarely full text anyway
+MAX_PAGES = int(os.environ.get("LIBRARY_MAX_PAGES", "200"))
+
+# Anything smaller is almost certainly a CAPTCHA or error page rather than a book
+MIN_PDF_BYTES = 50000
+
+# External OCR tools; PATH doesn't change during a run, so look them up once
+TESSERACT = shutil.which("tesseract")
+GHOSTSCRIPT = shutil.which("gswin64c") or shutil.which("gs")
+
+# PDF_POOL workers times ocrmypdf jobs per worker stays within the core count, so
+# concurrent OCRs don't oversubscribe the CPU with tesseract processes
+CPU_COUNT = os.cpu_count() or 4
+PDF_WORKERS = max(1, CPU_COUNT // 2)
+OCR_JOBS = max(1, CPU_COUNT // PDF_WORKERS)
 
 
 def check_dependencies():
     """Check for required and optional dependencies at startup."""
-    global SESSION
-
     missing_required = []
     missing_optional = []
 
     # Check required Python packages
-    try:
-        from pdfminer.high_level import extract_text
-    except ImportError:
+    if importlib.util.find_spec("pypdf") is None:
+        missing_required.append("pypdf (pip install pypdf)")
+
+    if importlib.util.find_spec("pdfminer") is None:
         missing_required.append("pdfminer.six (pip install pdfminer.six)")
 
-    try:
-        from requests.adapters import HTTPAdapter
-        from urllib3.util.retry import Retry
-
-        SESSION = requests.Session()
-        retry = Retry(
-            total=5,
-            backoff_factor=0.5,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["GET"],
-        )
-        SESSION.mount("https://", HTTPAdapter(max_retries=retry))
-        SESSION.headers.update({"User-Agent": "MVP-Library/0.1 (+no email)"})
-    except ImportError:
-        missing_required.append("requests (pip install requests)")
+    if aiohttp is None:
+        missing_required.append("aiohttp (pip install aiohttp)")
 
     # Optional OCR deps
-    if shutil.which("tesseract") is None:
+    if TESSERACT is None:
         missing_optional.append("tesseract (OCR will be unavailable)")
 
-    if shutil.which("gswin64c") is None and shutil.which("gs") is None:
+    if GHOSTSCRIPT is None:
         missing_optional.append("ghostscript (OCR will be unavailable)")
 
-    try:
-        import ocrmypdf
-    except ImportError:
+    if importlib.util.find_spec("ocrmypdf") is None:
         missing_optional.append("ocrmypdf (pip install ocrmypdf - OCR will be unavailable)")
 
     if missing_required:
@@ -73,32 +110,90 @@ def check_dependencies():
         log.warning("PDF text extraction will work, but OCR fallback will be unavailable.")
 
 
+@contextlib.asynccontextmanager
+async def open_url(session, url: str, timeout: float = 20, method: str = "GET", headers=None):
+    """Request a URL, retrying transient failures, and yield the response with its body unread."""
+    # Like requests' timeout: bounds connecting and each socket read, not the whole transfer
+    client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    for attempt in range(RETRY_TOTAL + 1):
+        try:
+            r = await session.request(method, url, timeout=client_timeout, headers=headers)
+        except aiohttp.ClientConnectionError:
+            if attempt == RETRY_TOTAL:
+                raise
+        else:
+            if r.status not in RETRY_STATUSES or attempt == RETRY_TOTAL:
+                break
+            r.release()
+        await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+    try:
+        yield r
+    finally:
+        r.release()
+
+async def fetch(session, url: str, timeout: float = 20, headers=None):
+    """GET a URL, retrying transient failures. The returned response has its body already read."""
+    async with open_url(session, url, timeout, headers=headers) as r:
+        await r.read()
+    return r
+
+
 class Downloaders:
     domain = None
     name = None
     headers = {"User-Agent": "MVP-Library/0.1 (+no email)"}
+    # Used when the server doesn't declare a charset, instead of sniffing multi-MB bodies
+    encoding = "utf-8"
+    # (source_url, etag, last_modified) of the copy already stored, set on --refresh runs
+    stored = None
+    # Cache validators of the copy just downloaded, and whether the server answered 304
+    etag = None
+    last_modified = None
+    not_modified = False
+    # Per-domain semaphore held by download_book while this download uses the network
+    slot = None
+
+    def release_slot(self):
+        """Give the domain's download slot back early, e.g. before CPU-bound PDF decoding."""
+        if self.slot is not None:
+            self.slot.release()
+            self.slot = None
 
     def get_id(self, url: str):
         raise NotImplementedError
 
-    def download(self):
+    async def download(self):
         raise NotImplementedError
 
-    def _download_text(self, urls: list[str]):
+    async def _download_text(self, urls: list[str]):
         for url in urls:
+            # Revalidate the stored copy instead of re-downloading it when nothing changed
+            headers = {}
+            if self.stored and self.stored[0] == url:
+                _, etag, last_modified = self.stored
+                if etag:
+                    headers["If-None-Match"] = etag
+                if last_modified:
+                    headers["If-Modified-Since"] = last_modified
             try:
-                r = SESSION.get(url, timeout=20, headers=self.headers)
-                if r.status_code == 200:
-                    return r, url
+                r = await fetch(SESSIONS[self.domain], url, headers=headers)
+                if r.status == 304:
+                    self.not_modified = True
+                    return None, None
+                if r.status == 200:
+                    self.etag = r.headers.get("ETag")
+                    self.last_modified = r.headers.get("Last-Modified")
+                    text = await r.text(encoding=r.charset or self.encoding, errors="replace")
+                    return text, url
             except Exception as e:
                 log.warning("Failed to fetch %s: %s", url, e)
         return None, None
 
-    def _get_json(self, url: str):
+    async def _get_json(self, url: str):
         try:
-            r = SESSION.get(url, timeout=20, headers=self.headers)
-            if r.status_code == 200:
-                return r.json(), url
+            r = await fetch(SESSIONS[self.domain], url)
+            if r.status == 200:
+                return await r.json(content_type=None), url
         except Exception as e:
             log.warning("Failed to fetch JSON %s: %s", url, e)
         return None, None
@@ -128,18 +223,18 @@ class GutenbergDownloader(Downloaders):
             return None
         return self.id
 
-    def download(self):
+    async def download(self):
         if self.id is None:
             return None, None
 
+        # The cache/epub file exists for almost every book; -0.txt is the older UTF-8 layout
         urls = [
+            f"https://www.gutenberg.org/cache/epub/{self.id}/pg{self.id}.txt",
             f"https://www.gutenberg.org/files/{self.id}/{self.id}-0.txt",
-            f"https://www.gutenberg.org/files/{self.id}/{self.id}.txt",
-            f"https://www.gutenberg.org/ebooks/{self.id}.txt.utf-8",
         ]
-        r, url = self._download_text(urls)
-        if r and r.text.strip():
-            return r.text, url
+        text, url = await self._download_text(urls)
+        if text and text.strip():
+            return text, url
         return None, None
 
 
@@ -157,7 +252,7 @@ class InternetArchiveDownloader(Downloaders):
         self.id = url.split("/details/")[1].split("/")[0]
         return self.id
 
-    def download(self):
+    async def download(self):
         if self.id is None:
             return None, None
 
@@ -165,12 +260,22 @@ class InternetArchiveDownloader(Downloaders):
             f"https://archive.org/download/{self.id}/{self.id}_djvu.txt",
             f"https://archive.org/download/{self.id}/{self.id}.txt",
         ]
-        r, url = self._download_text(urls)
-        if r and r.text.strip():
-            return r.text, url
+        text, url = await self._download_text(urls)
+        if text and text.strip():
+            return text, url
         return None, None
 
 
+GB_ID_PATTERNS = [
+    re.compile(pattern)
+    for pattern in (
+        r"/books/edition/[^/]+/([^?\/]+)",
+        r"\bid=([^&]+)",
+        r"/books\?id=([^&]+)",
+    )
+]
+
+
 class GoogleBooksDownloader(Downloaders):
     domain = "books.google."
     name = "gb_title_id"
@@ -180,19 +285,14 @@ class GoogleBooksDownloader(Downloaders):
         self.book = None
 
     def get_id(self, url: str):
-        patterns = [
-            r"/books/edition/[^/]+/([^?\/]+)",
-            r"\bid=([^&]+)",
-            r"/books\?id=([^&]+)",
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, url)
+        for pattern in GB_ID_PATTERNS:
+            match = pattern.search(url)
             if match:
                 self.id = match.group(1)
                 return self.id
         return None
 
-    def download(self):
+    async def download(self):
         if self.id is None:
             return None, None
 
@@ -200,18 +300,58 @@ class GoogleBooksDownloader(Downloaders):
         if api_key:
             url += f"?key={quote(api_key)}"
 
-        meta, _ = self._get_json(url)
+        meta, _ = await self._get_json(url)
         if not meta:
             return None, None
-        return extract_pdf(meta)
+        return await extract_pdf(meta, release_slot=self.release_slot)
 
 DOWNLOADERS = [GutenbergDownloader, InternetArchiveDownloader, GoogleBooksDownloader]
 
+# Books are written in batches; each commit is an fsync, so don't pay it per book
+COMMIT_BATCH_SIZE = 16
+
+# One upsert per source ID column, built once rather than per stored book
+INSERT_SQL = {
+    downloader.name: f"""
+        INSERT INTO books ({downloader.name}, author, title, category, source_url, content, etag, last_modified)
+        VALUES (?,?,?,?,?,?,?,?)
+        ON CONFLICT({downloader.name}) DO UPDATE SET
+          title=excluded.title,
+          category=excluded.category,
+          source_url=excluded.source_url,
+          content=excluded.content,
+          author=excluded.author,
+          etag=excluded.etag,
+          last_modified=excluded.last_modified
+    """
+    for downloader in DOWNLOADERS
+}
+
 # PDF text extraction functions
 
-def extract_text_from_pdf(pdf):
+def pdfminer_extract_text(pdf, max_pages: int):
+    from pdfminer.high_level import extract_text
+
+    # caching=False keeps pdfminer's resource manager from growing without bound on big PDFs
+    return extract_text(pdf, maxpages=max_pages, caching=False)
+
+def extract_text_from_pdf(pdf, max_pages: int):
+    from pypdf import PdfReader
+
+    # pypdf is several times faster than pdfminer and plain text is all we store
+    try:
+        pdf.seek(0)
+        reader = PdfReader(pdf)
+        pages = reader.pages[:max_pages] if max_pages else reader.pages
+        text = "\n".join(page.extract_text() or "" for page in pages)
+        if text.strip():
+            return text
+    except Exception:
+        log.warning("pypdf failed, falling back to pdfminer", exc_info=True)
+
     try:
-        text = extract_text(BytesIO(pdf.content))
+        pdf.seek(0)
+        text = pdfminer_extract_text(pdf, max_pages)
         if text and text.strip():
             return text
     except Exception:
@@ -219,44 +359,110 @@ def extract_text_from_pdf(pdf):
 
     return None
 
-def extract_ocr_from_pdf(pdf):
-    if shutil.which("tesseract") is None:
+def extract_ocr_from_pdf(pdf, max_pages: int):
+    if TESSERACT is None:
         log.info("Tesseract not found — skipping OCR")
         return None
 
     # Check for ghostscript
-    gs_cmd = shutil.which("gswin64c") or shutil.which("gs")
-    if gs_cmd is None:
+    if GHOSTSCRIPT is None:
         log.info("Ghostscript not found — skipping OCR")
         return None
     
     try:
-        proc = subprocess.run(
-            [sys.executable, "-m", "ocrmypdf",
-             "--skip-text", "--force-ocr", "-l", "eng", "-", "-"],
-            input=pdf.content,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,   # capture stderr for debugging
-            check=True,
-        )
-        text = extract_text(BytesIO(proc.stdout))
+        import ocrmypdf
+    except ImportError:
+        log.info("ocrmypdf not found — skipping OCR")
+        return None
+
+    # Only the OCR text is wanted, so ocrmypdf writes it to a sidecar file and skips
+    # producing an output PDF (which would otherwise have to be parsed again)
+    sidecar = tempfile.NamedTemporaryFile(suffix=".txt", delete=False)
+    sidecar.close()
+    # OCR is the slowest step, so don't run it on pages past the limit at all
+    pages = f"1-{max_pages}" if max_pages else None
+    try:
+        pdf.seek(0)
+        if hasattr(ocrmypdf, "ocr"):
+            # In-process API avoids a fresh interpreter + imports per PDF
+            ocrmypdf.ocr(
+                pdf, os.devnull,
+                jobs=OCR_JOBS, force_ocr=True,
+                output_type="none", sidecar=sidecar.name, pages=pages,
+                language=["eng"], progress_bar=False,
+            )
+        else:
+            args = [sys.executable, "-m", "ocrmypdf",
+                    "--jobs", str(OCR_JOBS), "--force-ocr",
+                    "--output-type", "none", "--sidecar", sidecar.name,
+                    "-l", "eng"]
+            if pages:
+                args += ["--pages", pages]
+            subprocess.run(
+                args + ["-", os.devnull],
+                stdin=pdf,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,   # capture stderr for debugging
+                check=True,
+            )
+        with open(sidecar.name, encoding="utf-8") as f:
+            text = f.read()
+        # Sidecar pages are separated by form feeds; drop the "[OCR skipped...]" tail
+        if max_pages:
+            text = "\f".join(text.split("\f")[:max_pages])
         if text and text.strip():
             return text
         else:
             log.warning("OCR produced no text")
     except Exception:
         log.exception("OCR failed")
+    finally:
+        os.unlink(sidecar.name)
     return None
 
-def convert_pdf_to_text(pdf):
-
-    text = extract_text_from_pdf(pdf)
-    if text is not None:
-        return text
-    else:
-        return extract_ocr_from_pdf(pdf)
-
-def extract_pdf(meta):
+def decode_pdf(path: str, max_pages: int):
+    """Worker-process entry point: extract text from the PDF file at `path`, falling back to OCR."""
+    with open(path, "rb") as pdf:
+        text = extract_text_from_pdf(pdf, max_pages)
+        if text is None:
+            text = extract_ocr_from_pdf(pdf, max_pages)
+    return text
+
+async def convert_pdf_to_text(path: str, digest: bytes):
+    """Return the text of the PDF at `path` (SHA-256 `digest`), from the cache when possible.
+
+    A cached row is only reused if it was extracted with no page limit or at least MAX_PAGES pages.
+    """
+    # The cache is only an optimization: a locked or broken cache must never cost us the PDF
+    if PDF_CACHE is not None:
+        try:
+            row = PDF_CACHE.execute("""
+                SELECT text FROM pdf_text_cache
+                WHERE sha256 = ? AND (max_pages = 0 OR (? != 0 AND max_pages >= ?))
+            """, (digest, MAX_PAGES, MAX_PAGES)).fetchone()
+        except sqlite3.Error:
+            log.warning("PDF text cache lookup failed", exc_info=True)
+            row = None
+        if row:
+            log.info("Using cached text for PDF %s", digest.hex()[:12])
+            return row[0]
+
+    # Other downloads keep progressing on the event loop while a worker decodes
+    text = await asyncio.wrap_future(PDF_POOL.submit(decode_pdf, path, MAX_PAGES))
+
+    if text is not None and PDF_CACHE is not None:
+        try:
+            PDF_CACHE.execute(
+                "INSERT OR REPLACE INTO pdf_text_cache (sha256, text, max_pages) VALUES (?, ?, ?)",
+                (digest, text, MAX_PAGES),
+            )
+            PDF_CACHE.commit()
+        except sqlite3.Error:
+            PDF_CACHE.rollback()
+            log.warning("Failed to cache text for PDF %s", digest.hex()[:12], exc_info=True)
+    return text
+
+async def extract_pdf(meta, release_slot=None):
     book_meta = (meta.get("accessInfo") or {}).get("pdf") or {}
     if not book_meta.get("isAvailable"):
         log.info("No downloadable PDF for this volume")
@@ -267,50 +473,183 @@ def extract_pdf(meta):
         log.warning("PDF marked available but no downloadLink present")
         return None, None
     
-    try:
-        pdf = SESSION.get(download_url, timeout=60, headers=Downloaders.headers)
-        log.info("Google PDF status=%s size=%s bytes", pdf.status_code, len(pdf.content))
+    session = SESSIONS[GoogleBooksDownloader.domain]
 
-        # Tiny PDFs are usually error/captcha pages
-        if pdf.status_code != 200 or len(pdf.content) < 50000:
+    # A HEAD is enough to spot most CAPTCHA/error pages without transferring them.
+    # Servers that reject HEAD or omit the headers just fall through to the GET checks.
+    try:
+        async with open_url(session, download_url, method="HEAD") as head:
+            size = head.content_length
+            if head.status == 200 and (
+                (size is not None and size < MIN_PDF_BYTES)
+                or head.content_type.startswith("text/html")
+            ):
+                log.info("Google PDF HEAD status=%s size=%s type=%s", head.status, size, head.content_type)
+                log.warning("Likely CAPTCHA or error page from Google — skipping")
+                return None, None
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        log.warning("PDF HEAD request failed (%s), trying GET", e)
+
+    # Stream to a temp file rather than holding (and copying) the whole PDF in memory;
+    # the worker process that parses it is handed the path
+    pdf = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+    try:
+        sha = hashlib.sha256()
+        with pdf:
+            try:
+                async with open_url(session, download_url, timeout=60) as r:
+                    # Tiny PDFs are usually error/captcha pages; reject on the header when we can
+                    size = r.content_length
+                    if r.status != 200 or (size is not None and size < MIN_PDF_BYTES):
+                        log.info("Google PDF status=%s size=%s bytes", r.status, size)
+                        log.warning("Likely CAPTCHA or error page from Google — skipping")
+                        return None, None
+                    async for chunk in r.content.iter_chunked(1 << 20):
+                        pdf.write(chunk)
+                        sha.update(chunk)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                log.exception("PDF download error")
+                return None, None
+            size = pdf.tell()
+
+        log.info("Google PDF status=%s size=%s bytes", r.status, size)
+        if size < MIN_PDF_BYTES:
             log.warning("Likely CAPTCHA or error page from Google — skipping")
             return None, None
-    except requests.RequestException:
-        log.exception("PDF download error")
-        return None, None
-    
-    return convert_pdf_to_text(pdf), download_url
 
+        # The download is done; let the next one from this domain start while we decode
+        if release_slot is not None:
+            release_slot()
+        text = await convert_pdf_to_text(pdf.name, sha.digest())
+    finally:
+        os.unlink(pdf.name)
+    return text, download_url
 
-def store_in_db(downloader: Downloaders, connection, cursor):
-    title_id, user_title, author, category = downloader.book
-    log.info("Downloading %s (%s)", title_id, downloader.domain)
-    text, url = downloader.download()
-    if text:
-        cursor.execute(f"""
-            INSERT INTO books ({downloader.name}, author, title, category, source_url, content)
-            VALUES (?,?,?,?,?,?)
-            ON CONFLICT({downloader.name}) DO UPDATE SET
-              title=excluded.title,
-              category=excluded.category,
-              source_url=excluded.source_url,
-              content=excluded.content,
-              author=excluded.author
-        """, (title_id, author, user_title, category, url, text))
+
+def store_in_db(pending: dict, connection, cursor):
+    """Write the pending rows (grouped by source ID column) in one transaction."""
+    if not pending:
+        return
+    try:
+        for name, rows in pending.items():
+            cursor.executemany(INSERT_SQL[name], rows)
         connection.commit()
-        log.info("Stored %s successfully", title_id)
+    except sqlite3.Error:
+        connection.rollback()
+        log.exception("Database write failed")
     else:
-        log.warning("Failed to store %s", title_id)
+        for rows in pending.values():
+            for row in rows:
+                log.info("Stored %s successfully", row[0])
+    pending.clear()
+
+def db_writer(results: queue.Queue, connection, cursor):
+    """Drain downloaded books from the queue into SQLite until a None sentinel arrives."""
+    pending = {}
+    count = 0
+    try:
+        while True:
+            item = results.get()
+            if item is None:
+                return
+            downloader, text, url = item
+            title_id, user_title, author, category = downloader.book
+            if downloader.not_modified:
+                log.info("Skipping %s (unchanged since last download)", title_id)
+                continue
+            if not text:
+                log.warning("Failed to store %s", title_id)
+                continue
+
+            pending.setdefault(downloader.name, []).append(
+                (title_id, author, user_title, category, url, text,
+                 downloader.etag, downloader.last_modified)
+            )
+            count += 1
+            if count >= COMMIT_BATCH_SIZE:
+                store_in_db(pending, connection, cursor)
+                count = 0
+    finally:
+        store_in_db(pending, connection, cursor)
+
+@contextlib.asynccontextmanager
+async def open_sessions():
+    """Open one pooled HTTP session per downloader domain for the duration of a run."""
+    for downloader in DOWNLOADERS:
+        SESSIONS[downloader.domain] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=POOL_SIZE,
+                limit_per_host=LIMIT_PER_HOST,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ),
+            headers={
+                **Downloaders.headers,
+                "Connection": "keep-alive",
+                "Accept-Encoding": "gzip, deflate",
+            },
+        )
+    try:
+        yield SESSIONS
+    finally:
+        for session in SESSIONS.values():
+            await session.close()
+        SESSIONS.clear()
+
+async def respect_rate_limit(domain: str, lock: asyncio.Lock, last_hit: dict,
+                             interval: float = RATE_LIMIT_INTERVAL):
+    """Wait until `interval` seconds have passed since the last download from `domain`.
+
+    `lock` is the domain's lock and `last_hit` maps domains to their last download start,
+    both created per run by process_input.
+    """
+    # Only this domain's downloads wait here; other domains keep running on the event loop
+    async with lock:
+        last = last_hit.get(domain)
+        if last is not None:
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - last)))
+        last_hit[domain] = time.monotonic()
+
+async def download_book(downloader: Downloaders, semaphore: asyncio.Semaphore,
+                        rate_lock: asyncio.Lock, last_hit: dict):
+    # Held across the network part only: downloaders may release it early via release_slot()
+    await semaphore.acquire()
+    downloader.slot = semaphore
+    try:
+        await respect_rate_limit(downloader.domain, rate_lock, last_hit)
+        log.info("Downloading %s (%s)", downloader.book[0], downloader.domain)
+        text, url = await downloader.download()
+    except Exception:
+        log.exception("Download failed for %s", downloader.book[0])
+        text, url = None, None
+    finally:
+        downloader.release_slot()
+    return downloader, text, url
 
-def process_input(data, connection, cursor):
-    total = len(data)
-    for idx, item in enumerate(data, 1):
-        lower = {k.lower(): v for k, v in item.items()}
+def get_field(item: dict, key: str):
+    """Look up an input field as "url", "Url" (what the app and template.json send) or "URL"."""
+    return item.get(key) or item.get(key.capitalize()) or item.get(key.upper())
 
-        url = lower.get("url")
-        book_title = lower.get("title")
-        author   = lower.get("author") or "Unknown"
-        category = lower.get("category") or "Uncategorized"
+def collect_jobs(data, cursor, refresh: bool = False):
+    """Match each input row to a downloader, skipping rows that are invalid or already stored.
+
+    With refresh, stored books are queued again along with their cache validators.
+    """
+    # Load every stored source ID up front instead of querying once per row
+    existing = {}
+    for downloader in DOWNLOADERS:
+        cursor.execute(f"""
+            SELECT {downloader.name}, source_url, etag, last_modified
+            FROM books WHERE {downloader.name} IS NOT NULL
+        """)
+        existing[downloader.name] = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    jobs = []
+    queued = set()
+    for item in data:
+        url = get_field(item, "url")
+        book_title = get_field(item, "title")
+        author   = get_field(item, "author") or "Unknown"
+        category = get_field(item, "category") or "Uncategorized"
 
         if not url or not book_title:
             continue
@@ -322,21 +661,60 @@ def process_input(data, connection, cursor):
         if source_id is None:
             continue;
 
-        cursor.execute(f"SELECT 1 FROM books WHERE {downloader.name} = ?", (source_id,))
-        if cursor.fetchone():
-            log.info("Skipping %s (already in database)", source_id)
+        if (downloader.name, source_id) in queued:
             continue
+        stored = existing[downloader.name].get(source_id)
+        if stored is not None:
+            if not refresh:
+                log.info("Skipping %s (already in database)", source_id)
+                continue
+            downloader.stored = stored
+        queued.add((downloader.name, source_id))
 
-        log.info("Progress %s/%s", idx, total)
         downloader.book = (source_id, book_title, author, category)
-        store_in_db(downloader, connection, cursor)
-        time.sleep(1)
+        jobs.append(downloader)
+    return jobs
+
+async def process_input(data, connection, cursor, refresh: bool = False):
+    global PDF_POOL
+
+    jobs = collect_jobs(data, cursor, refresh)
+    total = len(jobs)
+
+    # A single writer thread owns all SQLite writes while downloads run concurrently
+    results = queue.Queue()
+    writer = threading.Thread(target=db_writer, args=(results, connection, cursor))
+    writer.start()
+
+    semaphores = {d.domain: asyncio.Semaphore(PER_DOMAIN_CONCURRENCY) for d in DOWNLOADERS}
+    rate_locks = {d.domain: asyncio.Lock() for d in DOWNLOADERS}
+    last_hit = {}
+    PDF_POOL = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    try:
+        async with open_sessions():
+            tasks = [
+                download_book(d, semaphores[d.domain], rate_locks[d.domain], last_hit)
+                for d in jobs
+            ]
+            for idx, task in enumerate(asyncio.as_completed(tasks), 1):
+                result = await task
+                log.info("Progress %s/%s", idx, total)
+                results.put(result)
+    finally:
+        PDF_POOL.shutdown()
+        results.put(None)
+        writer.join()
 
 def init_database(db_path):
     """Initialize the database schema."""
-    connection = sqlite3.connect(db_path)
+    # The connection is handed to the db_writer thread once downloads start
+    connection = sqlite3.connect(db_path, check_same_thread=False)
     cursor = connection.cursor()
     cursor.executescript("""
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+
     CREATE TABLE IF NOT EXISTS books (
       id            INTEGER PRIMARY KEY,
       gutenberg_id  INTEGER UNIQUE,
@@ -346,7 +724,9 @@ def init_database(db_path):
       title         TEXT,
       category      TEXT,
       source_url    TEXT,
-      content       TEXT
+      content       TEXT,
+      etag          TEXT,
+      last_modified TEXT
     );
     
     CREATE UNIQUE INDEX IF NOT EXISTS idx_gutenberg
@@ -360,14 +740,30 @@ def init_database(db_path):
     CREATE UNIQUE INDEX IF NOT EXISTS idx_google
     ON books(gb_title_id)
     WHERE gb_title_id IS NOT NULL;
+
+    CREATE TABLE IF NOT EXISTS pdf_text_cache (
+      sha256        BLOB PRIMARY KEY,
+      text          TEXT,
+      max_pages     INTEGER   -- page limit the text was extracted with, 0 = all pages
+    );
     """)
+
+    # Columns added after the original schema; older databases need them appended
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(books)")}
+    for column in ("etag", "last_modified"):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE books ADD COLUMN {column} TEXT")
+    # Rows cached before the limit was recorded have max_pages NULL and are never reused
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(pdf_text_cache)")}
+    if "max_pages" not in columns:
+        cursor.execute("ALTER TABLE pdf_text_cache ADD COLUMN max_pages INTEGER")
     connection.commit()
     return connection, cursor
 
 
 def main():
     """Main entry point for the book downloader."""
-    global api_key
+    global api_key, PDF_CACHE, MAX_PAGES
     
     check_dependencies()
     
@@ -378,17 +774,25 @@ def main():
                     help="Path to SQLite database (default: library.db)")
     ap.add_argument("--api-key", default=None, 
                     help="Optional Google Books API key")
+    ap.add_argument("--max-pages", type=int, default=MAX_PAGES,
+                    help="Max PDF pages to extract text from, 0 for all (default: %(default)s, env LIBRARY_MAX_PAGES)")
+    ap.add_argument("--refresh", action="store_true",
+                    help="Re-check books already in the database; unchanged ones are skipped")
     args = ap.parse_args()
     
     api_key = args.api_key
+    MAX_PAGES = args.max_pages
     
     connection, cursor = init_database(args.db)
+    PDF_CACHE = sqlite3.connect(args.db)
+    PDF_CACHE.execute("PRAGMA synchronous=NORMAL;")
     
     try:
         data = json.loads(sys.stdin.read())
         
-        process_input(data, connection, cursor)
+        asyncio.run(process_input(data, connection, cursor, args.refresh))
     finally:
+        PDF_CACHE.close()
         connection.close()
 
 